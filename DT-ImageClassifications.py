@@ -1,7 +1,14 @@
 # put this python source code on the main folder of the dataset
 # command line scripts: "python3 thisfilename.py <trainingFolder> <testdataFolder> <csvoutputPrefix>"
-# constraints (1+2): <trainingFolder> and <testdataFolder> must exist
+# constraints (1+2): <trainingFolder> and <testdataFolder> must exist, either as image folders or packed into shards (see pack-ImageFolder.py)
 # constraints (3): <csvoutputPrefix> must make sure any generated files didn't already exist
+# options (anywhere on the command line): "--no-cache" decodes every image again instead of reusing cache/
+# "--batch=<size>" predicts the test images by batches of <size>, which bounds the memory used by predictions
+# "--jobs=<count>" predicts with a pool of <count> processes, each one scoring a shard of every batch
+# "--columnar=npz|parquet" writes the results of every configuration into one csv/<csvoutputPrefix>.<format> file
+# "--sparse" gives the module a sparse (CSR) matrix of the non-zero pixels instead of dense images
+# "--resolution=2|4|8|<width>x<height>" decodes the images at 1/2, 1/4 or 1/8 scale, or resized to that shape,
+# the outputs being named csv/<csvoutputPrefix>-r<resolution>...
 
 # data would be distributed as following:
 # a "training" folder, consists of labelled images
@@ -11,8 +18,8 @@
 from sys import argv
 import os, time, sys, psutil
 from sklearn.tree import DecisionTreeClassifier
-import cv2
 from glob import glob
+import imageloader, resultwriter, progresslog, predictionpool
 
 # initialize if the project folder doesn't contain a "csv" output folder yet
 if not 'csv/' in glob('*/'):
@@ -24,6 +31,14 @@ if not 'logs/' in glob('*/'):
 logname = "logs/logs-" + str(int(time.time() // 1)) + '.txt'
 global logfile; logfile = None
 
+# optional "--name[=value]" command line options, pulled out of argv (see imageloader.popOptions)
+global options; options = {}
+# dtype of the features given to the module: sklearn trees work on float32
+# pixels stay uint8 on disk and in the cache, and are converted once per run (see imageloader.asFeatures)
+featureDtype = 'float32'
+
+validOptions = ['no-cache', 'batch', 'jobs', 'columnar', 'sparse', 'resolution']
+
 # redefine "print" function to write in both stdout and logs
 def write(str, end='\n', flush=False):
     print(str, end=end, flush=flush)
@@ -31,6 +46,9 @@ def write(str, end='\n', flush=False):
 
 # exception handling
 def filteringException():
+    # options shared by every script
+    imageloader.checkOptions(options, validOptions, write, argv)
+
     if len(argv) != 4:
         # incorrect arguments count
         write('Incorrect format!')
@@ -51,7 +69,7 @@ def processArguments():
     # would be glad if paths being of any OS' but Windows :)
     trainingFolder = argv[1] + '/'
     testdataFolder = argv[2] + '/'
-    csvoutputPrefix = 'csv/' + argv[3]
+    csvoutputPrefix = 'csv/' + argv[3] + imageloader.resolutionSuffix(options.get('resolution', '1'))
 
     return trainingFolder, testdataFolder, csvoutputPrefix
 
@@ -59,78 +77,90 @@ def processArguments():
 def readImages_Training(trainingFolder):
     # initialize
     primalPath = trainingFolder
-    subfolderList = sorted(glob(primalPath + '*/'))
-    write('Begin loading from ' + primalPath + ' ...', flush=True)
-    cntimg = 0; totalcnt = 0
-    imgList = []; labelList = []
+    resolution = options.get('resolution', '1')
+    write('Begin loading from ' + primalPath + ' (' + imageloader.describeResolution(resolution) + ') ...', flush=True)
     startTime = time.time()
 
-    # iterate all subfolders
-    for path in subfolderList:
-        id = path.replace(primalPath, '').replace('/', '')
-        write('Begin loading from ' + path + ' ...', flush=True)
-        cntimg = 0
-        # iterate all images within subfolders
-        for filename in os.listdir(path):
-            imgList.append(cv2.imread(path + filename, 0).flatten())
-            labelList.append(id)
-            cntimg += 1; totalcnt += 1
-            write('Loading sample image #' + str(cntimg) + ' from folder #' + str(id) + '...\r', end='', flush=True)
-        write('', end='\n')
-    
+    # decode the images of all subfolders (or of all shards, if the folder was packed) in parallel
+    # into one preallocated matrix, one flattened image per row
+    # images unchanged since the last run are taken from the cache instead
+    # progress is redrawn twice a second at most, and logged once, as a structured record
+    progress = progresslog.Progress('load-training', write)
+    imgMatrix, labelList, cntcached = imageloader.loadTrainingFolder(primalPath, not options.get('no-cache'), progress=progress.update,
+                                                                     resolution=resolution)
+    progress.done(len(imgMatrix))
+
     # finalize and return value
     endTime = time.time()
-    write('Successfully loaded ' + str(totalcnt) + ' images.', flush=True)
+    write('Successfully loaded ' + str(len(imgMatrix)) + ' images in ' + str(len(set(labelList))) + ' labels (' + str(cntcached) + ' from cache).', flush=True)
     write('Elapsed time: ' + str(endTime - startTime) + ' seconds.', flush=True)
-    del primalPath, subfolderList, cntimg, totalcnt, startTime, endTime
-    return imgList, labelList
+    del primalPath, resolution, startTime, endTime
+    return imgMatrix, labelList
 
 # reading test data from test directories
 def readImages_TestData(testdataFolder):
     # initialize
     path = testdataFolder
-    write('Begin loading from ' + path + ' ...', flush=True)
-    cntimg = 0
-    tmpList = []; fnameList = []
+    resolution = options.get('resolution', '1')
+    write('Begin loading from ' + path + ' (' + imageloader.describeResolution(resolution) + ') ...', flush=True)
     startTime = time.time()
 
-    # iterate all images
-    for filename in os.listdir(path):
-        tmpList.append(cv2.imread(path + filename, 0).flatten())
-        fnameList.append(filename)
-        cntimg += 1
-        write('Loading test image #' + str(cntimg) + '...\r', end='', flush=True)
-    
+    # decode all images (or all shards, if the folder was packed) in parallel into one preallocated matrix
+    # images unchanged since the last run are taken from the cache instead
+    # progress is redrawn twice a second at most, and logged once, as a structured record
+    progress = progresslog.Progress('load-testdata', write)
+    # with "--batch" and without the cache, plain folders are only decoded batch by batch, when predicting
+    tmpMatrix, fnameList, cntcached = imageloader.loadTestFolder(path, not options.get('no-cache'), progress=progress.update,
+                                                                 lazy='batch' in options, resolution=resolution)
+    # lazily read images are not decoded yet: their decoding is part of the prediction, and logged with it
+    lazy = isinstance(tmpMatrix, imageloader.LazyImages)
+    if not lazy:
+        progress.done(len(tmpMatrix))
+
     # finalize and return value
     endTime = time.time()
-    write('\nSuccessfully loaded ' + str(cntimg) + ' images.', flush=True)
+    if lazy:
+        write('Listed ' + str(len(tmpMatrix)) + ' images, decoding deferred to prediction, batch by batch.', flush=True)
+    else:
+        write('Successfully loaded ' + str(len(tmpMatrix)) + ' images (' + str(cntcached) + ' from cache).', flush=True)
     write('Elapsed time: ' + str(endTime - startTime) + ' seconds.', flush=True)
-    del path, cntimg, startTime, endTime
-    return tmpList, fnameList
+    del path, resolution, startTime, endTime, lazy
+    return tmpMatrix, fnameList
 
-# perform predictions with given modules, target csv file and list of images to be predicted
-def prediction(module, csvFileName, testList, fnameList):
+# perform predictions with given modules, result writer, target csv file (and configuration)
+# and list of images to be predicted
+def prediction(module, results, csvFileName, config, testList, fnameList):
     # initialize
-    csvOutput = open(csvFileName, 'w')
-    csvOutput.write('ImageID,Label\n')
-    cntimg = len(testList)
+    target = results.begin(csvFileName, config)
+    cntimg = imageloader.countImages(testList)
     startTime = time.time()
 
-    # perform prediction by built-in predict() function
+    # perform prediction by built-in predict() function, batch by batch if "--batch" is given
+    # (the next batch being loaded while the current one is predicted), the whole test set at once otherwise
+    # with "--jobs", each batch is cut into shards predicted by a pool of processes, holding a copy of the module
     write('Begin predicting...', flush=True)
-    write('Writing target: ' + csvFileName + ' ...', flush=True)
-    labelList = module.predict(testList)
-
-    # writing prediction results into csv
-    for i in range(cntimg):
-        csvOutput.write(fnameList[i] + ',' + str(labelList[i]) + '\n')
+    write('Writing target: ' + target + ' ...', flush=True)
+    batchSize = int(options['batch']) if 'batch' in options else None
+    batches = imageloader.iterateBatches(testList, batchSize, featureDtype, 'sparse' in options) if batchSize else [(0, testList)]
+    nJobs = int(options['jobs']) if 'jobs' in options else 1
+    progress = progresslog.Progress('predict', write, total=cntimg)
+    predictor = predictionpool.PredictionPool(module, nJobs) if nJobs > 1 else module
+    for start, batch in batches:
+        labelList = predictor.predict(batch)
+
+        # writing prediction results of the whole batch at once, as soon as they are ready
+        results.write(fnameList[start:start + len(labelList)], labelList)
+        progress.update(start + len(labelList))
+    progress.done()
+    if nJobs > 1:
+        predictor.close()
     
     # finalize and close file output stream
     endTime = time.time()
     write('Successfully predicted ' + str(cntimg) + ' images.', flush=True)
     write('Elapsed time: ' + str(endTime - startTime) + ' seconds.', flush=True)
-    csvOutput.close()
-    del csvOutput, cntimg, startTime, endTime, labelList
+    results.end()
+    del target, cntimg, startTime, endTime, batches, predictor, progress
 
 # printing logs for consumed memories
 def displayMemory(MemBefore, MemAfter):
@@ -145,41 +175,58 @@ def mainFunction(process, trainingFolder, testdataFolder, csvPrefix):
     # reading test data
     testimgs, testnames = readImages_TestData(testdataFolder)
 
+    # converting the images once into the features of the module, shared by every fit and prediction
+    # (a sparse matrix of the non-zero pixels with "--sparse"), test images read by batches being converted batch by batch
+    imgs = imageloader.asFeatures(imgs, featureDtype, 'sparse' in options)
+    if 'batch' not in options:
+        testimgs = imageloader.asFeatures(testimgs, featureDtype, 'sparse' in options)
+    write('Features: ' + str(imgs.shape[1]) + ' ' + featureDtype + (' sparse' if 'sparse' in options else '') + ' per image, '
+          + '%.2f MiB for training.' % (imageloader.featureBytes(imgs) / 1048576), flush=True)
+
+    # results go into one csv per configuration, or all of them into one columnar file with "--columnar"
+    results = resultwriter.ResultWriter(csvPrefix + '.' + options['columnar'] if 'columnar' in options else None)
+
     # initialize output csv
     csvResult = csvPrefix + '.csv'
 
     # terminate if output csv file exists
-    if os.path.isfile(csvResult):
+    if results.columnarPath is None and os.path.isfile(csvResult):
         write('Error, file {} already exists!'.format(csvResult))
         sys.exit(-4096)
 
     # initialize module
-    write('\nBegin training using ' + str(len(imgs)) + ' images...', flush=True)
+    write('\nBegin training using ' + str(imgs.shape[0]) + ' images...', flush=True)
     MemBefore = process.memory_info().rss
     startTime = time.time()
     DT_Module = DecisionTreeClassifier(criterion='entropy', splitter='best')
     DT_Module.fit(imgs, labels)
     endTime = time.time()
     MemAfter = process.memory_info().rss
-    write('Successfully fitted ' + str(len(imgs)) + ' images.', flush=True)
+    write('Successfully fitted ' + str(imgs.shape[0]) + ' images.', flush=True)
     write('Elapsed time: ' + str(endTime - startTime) + ' seconds.', flush=True)
     displayMemory(MemBefore, MemAfter)
 
     # perform prediction
-    prediction(DT_Module, csvResult, testimgs, testnames)
+    prediction(DT_Module, results, csvResult, 'criterion=entropy', testimgs, testnames)
     del DT_Module, startTime, endTime, MemBefore, MemAfter
 
+    # writing the columnar file, if any
+    if results.columnarPath is not None:
+        results.finish()
+        write('Results saved into ' + results.columnarPath + '.', flush=True)
+
 if __name__ == "__main__":
     # initialize memory monitor
     this_process = psutil.Process(os.getpid())
 
-    # initialize logfiles
-    logfile = open(logname, 'w')
+    # initialize logfiles, buffered by blocks of 1 MiB rather than written line by line
+    logfile = open(logname, 'w', buffering=1048576)
     logfile.write('Command line: python3 ')
     for arg in argv: logfile.write(arg + ' ')
     logfile.write('\n\n')
 
-    # handling exceptions and arguments
+    # handling exceptions and arguments, options being pulled out first
+    options = imageloader.popOptions(argv)
     filteringException()
     trainingFolder, testdataFolder, csvPrefix = processArguments()
     
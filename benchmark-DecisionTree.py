@@ -0,0 +1,168 @@
+# put this python source code next to decisiontree.py
+# command line scripts: "python3 thisfilename.py <csvoutputPrefix> [<preset>]"
+# constraints (1): <csvoutputPrefix> must make sure any generated files didn't already exist
+# constraints (2): <preset> is optional ("quick" by default), yet if defined, must be either "quick" or "full"
+
+# benchmarks the from-scratch decision tree (decisiontree.py) on synthetic classification datasets
+# generated locally, for every (rows, features, classes) of the preset and every build mode:
+# build time and predict time are measured separately (best of several runs), then peak memory
+# of each stage in a separate traced run, as well as the calcEntropy/calcGain kernels
+# results go into csv/<csvoutputPrefix>.csv, one row per measure, tagged with the current commit
+
+from sys import argv
+import os, time, sys, subprocess, tracemalloc
+import numpy as np
+from glob import glob
+import decisiontree as dt
+
+# initialize if the project folder doesn't contain a "csv" output folder yet
+if not 'csv/' in glob('*/'):
+    os.mkdir("csv/")
+
+# logs initialization
+if not 'logs/' in glob('*/'):
+    os.mkdir("logs/")
+logname = "logs/logs-" + str(int(time.time() // 1)) + '.txt'
+global logfile; logfile = None
+
+# datasets and build modes of each preset
+# trees are capped at depth 12, so that build time follows the data size instead of the noise
+presets = {
+    "quick": {"rows": [1000, 10000], "features": [4, 16], "classes": [2, 8]},
+    "full": {"rows": [1000, 10000, 100000, 1000000], "features": [4, 16, 64], "classes": [2, 8, 32]}
+}
+modes = {
+    "exact": {"maxDepth": 12},
+    "histogram": {"maxDepth": 12, "histogram": True}
+}
+repeats = 3
+
+# columns of the output csv
+csvColumns = ["commit", "timestamp", "rows", "features", "classes", "mode", "stage",
+              "seconds", "rowsPerSecond", "peakMiB", "nodes", "accuracy"]
+
+# redefine "print" function to write in both stdout and logs
+def write(str, end='\n', flush=False):
+    print(str, end=end, flush=flush)
+    logfile.write(str+end)
+
+# exception handling
+def filteringException():
+    if len(argv) != 2 and len(argv) != 3:
+        # incorrect arguments count
+        write('Incorrect format!')
+        write('Valid format: "python3 thisfilename.py <csvoutputPrefix> [<preset>]"')
+        sys.exit(-1)
+    else:
+        # output csv already exists
+        if os.path.isfile('csv/' + argv[1] + '.csv'):
+            write('Error, file {} already exists!'.format('csv/' + argv[1] + '.csv'))
+            sys.exit(-4096)
+
+        # illegal preset (argv[2])
+        if len(argv) == 3 and argv[2] not in presets:
+            write('Invalid argv[2]: <preset> can only be "quick" or "full"!')
+            sys.exit(-12)
+
+# processing arguments after surpassed all exception tests
+def processArguments():
+    csvResult = 'csv/' + argv[1] + '.csv'
+    preset = argv[2] if len(argv) == 3 else "quick"
+    return csvResult, preset
+
+# commit being benchmarked, "unknown" outside of a git checkout
+def currentCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+# synthetic classification dataset: one gaussian blob per class in the space of the features
+# classes overlap, so that trees have something to learn without being trivially pure
+# returns a training set and a test set of nRows rows each, drawn around the same centers
+def makeDataset(nRows, nFeatures, nClasses, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(nClasses, nFeatures))
+    y = rng.integers(0, nClasses, 2 * nRows)
+    X = centers[y] + rng.normal(size=(2 * nRows, nFeatures))
+    return X[:nRows], y[:nRows], X[nRows:], y[nRows:]
+
+# best wall time of 'repeats' calls of function(), with the result of the last call
+def bestTime(function):
+    best = np.inf
+    for i in range(repeats):
+        startTime = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - startTime)
+    return best, result
+
+# peak memory (MiB) traced while calling function() once
+def peakMemory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 1048576
+    finally:
+        tracemalloc.stop()
+
+# main function of this source code
+def mainFunction(csvResult, preset):
+    commit = currentCommit(); timestamp = int(time.time())
+    csvOutput = open(csvResult, 'w')
+    csvOutput.write(','.join(csvColumns) + '\n')
+    write('Benchmarking commit ' + commit + ' with preset "' + preset + '"...', flush=True)
+
+    # writing one measure into the csv as soon as it is taken
+    def record(rows, features, classes, mode, stage, seconds, peakMiB, nodes='', accuracy=''):
+        values = [commit, timestamp, rows, features, classes, mode, stage, '%.6f' % seconds,
+                  '%.1f' % (rows / seconds if seconds > 0 else 0.0), '%.2f' % peakMiB, nodes, accuracy]
+        csvOutput.write(','.join(str(value) for value in values) + '\n')
+        csvOutput.flush()
+
+    for nRows in presets[preset]["rows"]:
+        for nFeatures in presets[preset]["features"]:
+            for nClasses in presets[preset]["classes"]:
+                X, y, testX, testy = makeDataset(nRows, nFeatures, nClasses, seed=nRows + nFeatures + nClasses)
+
+                # kernels: entropy and gain of every candidate threshold of one column at the root
+                counts = np.cumsum(np.eye(nClasses, dtype=np.int64)[y], axis=0)[:-1]
+                parentCounts = np.bincount(y, minlength=nClasses)
+                seconds, result = bestTime(lambda: dt.calcEntropy(counts))
+                record(nRows, nFeatures, nClasses, '-', 'calcEntropy', seconds, peakMemory(lambda: dt.calcEntropy(counts)))
+                seconds, result = bestTime(lambda: dt.calcGain(parentCounts, counts, parentCounts - counts))
+                record(nRows, nFeatures, nClasses, '-', 'calcGain', seconds,
+                       peakMemory(lambda: dt.calcGain(parentCounts, counts, parentCounts - counts)))
+
+                for mode, options in modes.items():
+                    # build on the training set, then predict the test set
+                    seconds, model = bestTime(lambda: dt.buildTree(X, y, **options))
+                    record(nRows, nFeatures, nClasses, mode, 'build', seconds,
+                           peakMemory(lambda: dt.buildTree(X, y, **options)), len(model))
+                    seconds, predicted = bestTime(lambda: model.predictCodes(testX))
+                    accuracy = '%.4f' % np.mean(predicted == testy)
+                    record(nRows, nFeatures, nClasses, mode, 'predict', seconds,
+                           peakMemory(lambda: model.predictCodes(testX)), len(model), accuracy)
+                    write('rows = {}, features = {}, classes = {}, mode = {}: {} nodes, accuracy {}.'.format(
+                        nRows, nFeatures, nClasses, mode, len(model), accuracy), flush=True)
+
+    csvOutput.close()
+    write('Results saved into ' + csvResult + '.', flush=True)
+
+if __name__ == "__main__":
+    # initialize logfiles
+    logfile = open(logname, 'w')
+    logfile.write('Command line: python3 ')
+    for arg in argv: logfile.write(arg + ' ')
+    logfile.write('\n\n')
+
+    # handling exceptions and arguments
+    filteringException()
+    csvResult, preset = processArguments()
+
+    # main benchmarking
+    mainFunction(csvResult, preset)
+
+    # finish logging
+    logfile.close()
+    print('Logs saved into ' + logname + '.')
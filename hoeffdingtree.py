@@ -0,0 +1,203 @@
+# this is a script used to learn a decision tree incrementally (Hoeffding tree) from a csv file
+# read in fixed-size chunks, so the whole dataset never has to fit in memory
+# command line scripts: "python3 thisfilename.py <csvFile> <targetColumn> [<chunkSize>]"
+# constraints (1+2): <csvFile> must exist, with a header line holding <targetColumn> among its columns
+# constraints (3): <chunkSize> is optional (10000 by default), yet if defined, must be a positive integer
+
+# each leaf node keeps sufficient statistics: class counts per (column, bucket), buckets being fixed
+# from the first chunk (see decisiontree.binFeatures); a leaf is split once the Hoeffding bound
+# says that its best criteria beats the best criteria of every other column, with probability 1 - delta
+
+from sys import argv
+import os, sys
+import numpy as np
+import pandas as pd
+import decisiontree as dt
+
+class HoeffdingTree:
+    # nBins: max number of buckets per column, i.e. of candidate thresholds (+1) per column
+    # delta: probability of choosing a wrong criteria at each split
+    # tieThreshold: split anyway once the bound gets below it, the best criteria being then as good as tied
+    # gracePeriod: number of rows a leaf node sees between two split attempts
+    # maxLeaves: the tree stops growing at that many leaf nodes, which bounds the memory of the statistics
+    def __init__(self, featureNames, classNames=None, nBins=32, delta=1e-7, tieThreshold=0.05,
+                 gracePeriod=200, maxLeaves=1024):
+        self.featureNames = list(featureNames)
+        self.classNames = [] if classNames is None else list(classNames)
+        self.nBins = nBins; self.delta = delta; self.tieThreshold = tieThreshold
+        self.gracePeriod = gracePeriod; self.maxLeaves = maxLeaves
+        self.nRows = 0
+
+        # cut points per column, fixed by the first chunk
+        self.cuts = None
+
+        # node arrays of the tree (same meaning as in decisiontree.TreeModel), starting with a single leaf
+        self.feature = [-1]; self.threshold = [0.0]; self.left = [-1]; self.right = [-1]; self.value = [0]
+
+        # statistics of each leaf node: stats[leaf][colid, bucket, class] counts rows
+        # and the number of rows the leaf has seen since its last split attempt
+        self.stats = {}; self.seen = {}
+
+    # number of leaf nodes in the tree
+    def leafCount(self):
+        return self.feature.count(-1)
+
+    # class codes of the labels, classes never seen before being added to classNames
+    def encodeLabels(self, labels):
+        distinct, inverse = np.unique(np.asarray(labels), return_inverse=True)
+        mapping = np.empty(distinct.size, dtype=np.int64)
+        added = 0
+        for enum, label in enumerate(distinct.tolist()):
+            if label not in self.classNames:
+                self.classNames.append(label); added += 1
+            mapping[enum] = self.classNames.index(label)
+
+        # statistics get one more class slot per new class
+        if added > 0:
+            for leaf in self.stats:
+                self.stats[leaf] = np.pad(self.stats[leaf], ((0, 0), (0, 0), (0, added)))
+        return mapping[inverse.ravel()]
+
+    # statistics of a new leaf node
+    def newStats(self):
+        return np.zeros((len(self.featureNames), self.binCount, len(self.classNames)), dtype=np.int64)
+
+    # learning from one chunk of rows: the rows are routed to their leaf nodes, whose statistics are
+    # updated, then every leaf node which has seen gracePeriod new rows attempts a split
+    def learn(self, X, labels):
+        if hasattr(X, "columns"):
+            X = X[self.featureNames]
+        X = np.asarray(X, dtype=float)
+        y = self.encodeLabels(labels)
+
+        # buckets of every column are fixed by the first chunk
+        if self.cuts is None:
+            self.cuts = dt.binFeatures(X, self.nBins)[1]
+            self.binCount = max(cut.size for cut in self.cuts) + 1
+            self.canSplit = np.arange(self.binCount - 1) < np.array([cut.size for cut in self.cuts])[:, None]
+            self.stats[0] = self.newStats(); self.seen[0] = 0
+        codes = np.empty(X.shape, dtype=np.int64)
+        for colid, cut in enumerate(self.cuts):
+            codes[:, colid] = np.searchsorted(cut, X[:, colid], side="right")
+
+        # routing the rows, then grouping them by leaf node
+        leaves = self.model().apply(X)
+        order = np.argsort(leaves, kind="stable")
+        groups = np.split(order, np.flatnonzero(np.diff(leaves[order])) + 1)
+
+        nFeatures = len(self.featureNames); nClasses = len(self.classNames)
+        offsets = np.arange(nFeatures) * self.binCount
+        for rows in groups:
+            if rows.size == 0:
+                continue
+            leaf = int(leaves[rows[0]])
+            flat = ((offsets + codes[rows]) * nClasses + y[rows, None]).ravel()
+            self.stats[leaf] += np.bincount(flat, minlength=self.stats[leaf].size).reshape(self.stats[leaf].shape)
+            self.value[leaf] = int(np.argmax(self.stats[leaf][0].sum(axis=0)))
+            self.seen[leaf] += rows.size
+            if self.seen[leaf] >= self.gracePeriod:
+                self.seen[leaf] = 0
+                self.attemptSplit(leaf)
+
+        self.nRows += y.size
+
+    # splitting the leaf node 'leaf' if the Hoeffding bound allows it
+    def attemptSplit(self, leaf):
+        hist = self.stats[leaf]
+        parentCounts = hist[0].sum(axis=0)
+        if np.count_nonzero(parentCounts) < 2 or self.leafCount() >= self.maxLeaves:
+            return
+
+        # information gain of every (column, bucket) criteria, as in decisiontree.findBestSplitHistogram
+        leftCounts = np.cumsum(hist, axis=1)[:, :-1, :]
+        rightCounts = parentCounts - leftCounts
+        valid = self.canSplit & (leftCounts.sum(axis=-1) > 0) & (rightCounts.sum(axis=-1) > 0)
+        gains = np.where(valid, dt.calcGain(parentCounts, leftCounts, rightCounts), -np.inf)
+
+        # best criteria of the best column, against the best criteria of the second best column
+        columnGains = gains.max(axis=1)
+        ranking = np.argsort(-columnGains, kind="stable")
+        bestGain = columnGains[ranking[0]]
+        if not np.isfinite(bestGain):
+            return
+        secondGain = columnGains[ranking[1]] if ranking.size > 1 and np.isfinite(columnGains[ranking[1]]) else 0.0
+
+        # Hoeffding bound, information gain ranging over log2(number of classes)
+        n = parentCounts.sum()
+        gainRange = np.log2(max(len(self.classNames), 2))
+        epsilon = np.sqrt(gainRange ** 2 * np.log(1 / self.delta) / (2 * n))
+        if bestGain - secondGain <= epsilon and epsilon >= self.tieThreshold:
+            return
+
+        # the leaf becomes an inner node, its children start with empty statistics
+        # but are labelled by the major specie on their side of the criteria
+        colid = int(ranking[0]); b = int(np.argmax(gains[colid]))
+        self.feature[leaf] = colid; self.threshold[leaf] = float(self.cuts[colid][b])
+        for side, counts in ((self.left, leftCounts[colid, b]), (self.right, rightCounts[colid, b])):
+            self.feature.append(-1); self.threshold.append(0.0); self.left.append(-1); self.right.append(-1)
+            self.value.append(int(np.argmax(counts)))
+            side[leaf] = len(self.feature) - 1
+            self.stats[side[leaf]] = self.newStats(); self.seen[side[leaf]] = 0
+        self.value[leaf] = -1
+        del self.stats[leaf], self.seen[leaf]
+
+    # snapshot of the tree learnt so far, as a TreeModel
+    def model(self):
+        classNames = self.classNames if self.classNames else [None]
+        return dt.TreeModel(self.feature, self.threshold, self.left, self.right, self.value,
+                            self.featureNames, classNames)
+
+    # class name predicted for each row of X by the tree learnt so far
+    def predict(self, X):
+        return self.model().predict(X)
+
+# reading a csv file by chunks of chunkSize rows: yields (feature matrix, labels) per chunk
+def streamCsv(path, target, chunkSize=10000):
+    for chunk in pd.read_csv(path, chunksize=chunkSize):
+        yield chunk.drop(columns=[target]), chunk[target].to_numpy()
+
+# exception handling
+def filteringException():
+    if len(argv) != 3 and len(argv) != 4:
+        # incorrect arguments count
+        print('Incorrect format!')
+        print('Valid format: "python3 thisfilename.py <csvFile> <targetColumn> [<chunkSize>]"')
+        sys.exit(-1)
+    else:
+        # file not found
+        if not os.path.isfile(argv[1]):
+            print('Csv file "{}" not found!'.format(argv[1]))
+            sys.exit(-4041)
+
+        # target column not found
+        if argv[2] not in pd.read_csv(argv[1], nrows=0).columns:
+            print('Column "{}" not found in "{}"!'.format(argv[2], argv[1]))
+            sys.exit(-4042)
+
+        if len(argv) == 4:
+            # non-integers arguments at argv[3]
+            try: int(argv[3])
+            except ValueError as ex3:
+                print('{} cannot be parsed into int: {}'.format(argv[3], ex3))
+                sys.exit(-43)
+
+            # non-positive arguments at argv[3]
+            if int(argv[3]) <= 0:
+                print('Invalid argv[3]: <chunkSize> must be a positive integer!')
+                sys.exit(-443)
+
+if __name__ == "__main__":
+    # handling exceptions and arguments
+    filteringException()
+    path, target = argv[1], argv[2]
+    chunkSize = int(argv[3]) if len(argv) == 4 else 10000
+
+    # learning chunk by chunk, the tree can be queried after every chunk
+    featureNames = [colLabel for colLabel in pd.read_csv(path, nrows=0).columns if colLabel != target]
+    tree = HoeffdingTree(featureNames)
+    for X, labels in streamCsv(path, target, chunkSize):
+        tree.learn(X, labels)
+        print('Learnt {} rows: {} leaf nodes.'.format(tree.nRows, tree.leafCount()), flush=True)
+
+    # display the tree, starting from root
+    dt.displayTree(tree.model())
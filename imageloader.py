@@ -0,0 +1,602 @@
+# image loading shared by the *-ImageClassifications.py scripts
+# images are listed first, then decoded by a pool of threads (OpenCV releases the GIL while decoding)
+# straight into one preallocated uint8 matrix, one flattened grayscale image per row
+# decoded folders are cached under cache/ as .npy files, with a manifest of (path, size, mtime)
+# per image, so that later runs memory-map the cache and only decode added or changed images
+# images are decoded at full resolution, or straight at 1/2, 1/4 or 1/8 scale, or resized to a fixed shape
+# folders can also be packed into a few large shard files (see pack-ImageFolder.py), which are read
+# sequentially, one whole shard at a time, and decoded in parallel, in chunks of images of each shard
+# it also holds what the scripts do with the decoded images before fitting and predicting: the checks of
+# the shared command line options, the conversion of images into features, batch by batch if needed,
+# and the optional PCA / random projection of those features, cached next to the decoded training folder
+# (predicting with several processes is in predictionpool.py, writing the results in resultwriter.py)
+
+import os, sys, re, json, hashlib, struct
+import numpy as np
+import scipy.sparse
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+import resultwriter
+
+# folder of the decoded-dataset caches
+cacheFolder = 'cache/'
+
+# shard files: header (magic, version, image count, table length), a json table of the labels and
+# filenames, the offsets of the images (count + 1, relative to the data), the label code of each
+# image (-1 if unlabelled), then the encoded images (png, jpeg...) as they were on disk, back to back
+# a shard folder lists its shards, in order, in shards.json
+shardMagic = b"IMGSHARD"
+shardVersion = 1
+shardHeader = struct.Struct("<8sIIQ")
+shardIndex = 'shards.json'
+
+# pulling the "--name" / "--name=value" options out of the command line arguments, in place,
+# so that the positional arguments keep their indices; returns {name: value, or True if no value}
+def popOptions(argv):
+    options = {}
+    for arg in [arg for arg in argv[1:] if arg.startswith('--')]:
+        name, sep, value = arg[2:].partition('=')
+        options[name] = value if sep else True
+        argv.remove(arg)
+    return options
+
+# checking the options shared by the *-ImageClassifications.py scripts, as popped by popOptions, against
+# the script's validOptions; each invalid option is reported by write, then exits as the scripts do
+# argv (the positional arguments) gives the output prefix, argv[3], of the columnar file
+def checkOptions(options, validOptions, write, argv):
+    # unknown options
+    for name in options:
+        if name not in validOptions:
+            write('Unknown option "--{}"!'.format(name))
+            sys.exit(-2)
+
+    # batch size and number of jobs must be positive integers
+    for name in ['batch', 'jobs']:
+        if name in options:
+            if options[name] is True:
+                write('Invalid option: --{} needs a value, as in "--{}=<integer>"!'.format(name, name))
+                sys.exit(-3)
+            try: int(options[name])
+            except ValueError as exo:
+                write('--{}={} cannot be parsed into int: {}'.format(name, options[name], exo))
+                sys.exit(-3)
+            if int(options[name]) <= 0:
+                write('Invalid option: --{} must be a positive integer!'.format(name))
+                sys.exit(-33)
+
+    # resolution must be "2", "4", "8" or "<width>x<height>"
+    if 'resolution' in options and (options['resolution'] is True or not isResolution(options['resolution'])):
+        write('Invalid option: --resolution can only be 2, 4, 8 or <width>x<height>!')
+        sys.exit(-35)
+
+    # projection must be "pca:<n>" or "random:<n>", and projected features are dense
+    if 'projection' in options:
+        if options['projection'] is True or not isProjection(options['projection']):
+            write('Invalid option: --projection can only be pca:<components> or random:<components>!')
+            sys.exit(-36)
+        if 'sparse' in options:
+            write('Invalid option: --sparse cannot be used with --projection, projected features being dense!')
+            sys.exit(-36)
+
+    # engine must be "balltree" or "blocked", the blocked one taking dense features only
+    if 'engine' in options:
+        if options['engine'] not in ['balltree', 'blocked']:
+            write('Invalid option: --engine can only be "balltree" or "blocked"!')
+            sys.exit(-37)
+        if options['engine'] == 'blocked' and 'sparse' in options:
+            write('Invalid option: --sparse cannot be used with --engine=blocked, which takes dense features only!')
+            sys.exit(-37)
+
+    # columnar format must be known and available, the columnar file must not exist yet
+    if 'columnar' in options:
+        if options['columnar'] not in resultwriter.columnarFormats:
+            write('Invalid option: --columnar can only be "npz" or "parquet"!')
+            sys.exit(-34)
+        if not resultwriter.columnarFormats[options['columnar']]:
+            write('Invalid option: --columnar={} needs pyarrow to be installed!'.format(options['columnar']))
+            sys.exit(-34)
+        if len(argv) > 3:
+            columnarPath = 'csv/' + argv[3] + resolutionSuffix(options.get('resolution', '1')) + '.' + options['columnar']
+            if os.path.isfile(columnarPath):
+                write('Error, file {} already exists!'.format(columnarPath))
+                sys.exit(-4096)
+
+# checking the size of "--projection" against the training images imgMatrix (images x pixels), once decoded:
+# PCA keeps at most min(images, pixels) components, a random projection must go into fewer dimensions than
+# there are pixels; an invalid size is reported by write, then exits as checkOptions does
+def checkProjection(method, imgMatrix, write):
+    kind, components = method.split(':'); components = int(components)
+    if kind == 'pca' and components > min(imgMatrix.shape):
+        write('Invalid option: --projection={} keeps at most {} components here ({} images of {} pixels)!'.format(
+              method, min(imgMatrix.shape), imgMatrix.shape[0], imgMatrix.shape[1]))
+        sys.exit(-36)
+    if kind == 'random' and components >= imgMatrix.shape[1]:
+        write('Invalid option: --projection={} must project into fewer than the {} pixels of the images!'.format(method, imgMatrix.shape[1]))
+        sys.exit(-36)
+
+# resolutions of the decoded images: "1" (full), "2", "4" or "8" (decoded straight at 1/2, 1/4 or 1/8
+# scale by OpenCV's reduced grayscale reads), or "<width>x<height>" (resized to that shape)
+reducedFlags = {'1': cv2.IMREAD_GRAYSCALE, '2': cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                '4': cv2.IMREAD_REDUCED_GRAYSCALE_4, '8': cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+# whether 'resolution' is a valid resolution
+def isResolution(resolution):
+    return resolution in reducedFlags or re.fullmatch(r'[1-9][0-9]*x[1-9][0-9]*', resolution) is not None
+
+# readable description of a resolution, for logging
+def describeResolution(resolution):
+    if resolution == '1':
+        return 'full resolution'
+    if resolution in reducedFlags:
+        return '1/' + resolution + ' scale'
+    return 'resized to ' + resolution + ' pixels'
+
+# suffix of the names (outputs, caches) of a resolution, empty for the full resolution
+def resolutionSuffix(resolution):
+    return '' if resolution == '1' else '-r' + resolution
+
+# flag of cv2.imread/cv2.imdecode, and (width, height) to resize into (None to keep the decoded shape)
+def resolutionFlags(resolution):
+    if resolution in reducedFlags:
+        return reducedFlags[resolution], None
+    return cv2.IMREAD_GRAYSCALE, tuple(int(side) for side in resolution.split('x'))
+
+# flattened grayscale row of a decoded image (None if decoding failed), resized if 'shape' is given
+def flattenImage(img, shape, name):
+    if img is None:
+        raise ValueError('Cannot decode image "{}"!'.format(name))
+    if shape is not None and (img.shape[1], img.shape[0]) != shape:
+        img = cv2.resize(img, shape, interpolation=cv2.INTER_AREA)
+    return img.ravel()
+
+# listing a training folder, which has one subfolder per label, named after that label
+# returns the paths of the images and their labels (an array aligned with the paths)
+def listTrainingImages(trainingFolder):
+    pathList = []; labelList = []
+    for path in sorted(glob(trainingFolder + '*/')):
+        id = path.replace(trainingFolder, '').replace('/', '')
+        for filename in os.listdir(path):
+            pathList.append(path + filename)
+            labelList.append(id)
+    return pathList, np.array(labelList)
+
+# listing a test folder of unlabelled images
+# returns the paths of the images and their filenames
+def listTestImages(testdataFolder):
+    fnameList = os.listdir(testdataFolder)
+    return [testdataFolder + filename for filename in fnameList], fnameList
+
+# decoding one image into a flattened grayscale row, at the given resolution
+def decodeImage(path, resolution='1'):
+    flag, shape = resolutionFlags(resolution)
+    return flattenImage(cv2.imread(path, flag), shape, path)
+
+# decoding every image of pathList into one (images x pixels) uint8 matrix, allocated once
+# the images are decoded by nWorkers threads (one per core by default), all of the same size
+# the matrix is np.empty((len(pathList), width)) by default, or allocate(width) once the first image
+# gives the width (e.g. a memory-mapped file), image enum being written into its row rows[enum]
+# progress(count) is called from the calling thread after each decoded image, in order
+def decodeImages(pathList, nWorkers=None, progress=None, resolution='1', allocate=None, rows=None):
+    if len(pathList) == 0:
+        return np.empty((0, 0), dtype=np.uint8)
+    if rows is None:
+        rows = range(len(pathList))
+
+    # the first image gives the width of the matrix
+    first = decodeImage(pathList[0], resolution)
+    if allocate is None:
+        imgMatrix = np.empty((len(pathList), first.size), dtype=np.uint8)
+    else:
+        imgMatrix = allocate(first.size)
+
+    # each thread writes its image straight into its own row
+    def decodeInto(enum, pixels=None):
+        if pixels is None:
+            pixels = decodeImage(pathList[enum], resolution)
+        if pixels.size != imgMatrix.shape[1]:
+            raise ValueError('Image "{}" has {} pixels, expected {}!'.format(pathList[enum], pixels.size, imgMatrix.shape[1]))
+        imgMatrix[rows[enum]] = pixels
+
+    decodeInto(0, first)
+    if progress is not None:
+        progress(1)
+    with ThreadPoolExecutor(max_workers=nWorkers or os.cpu_count()) as pool:
+        for count, done in enumerate(pool.map(decodeInto, range(1, len(pathList))), 2):
+            if progress is not None:
+                progress(count)
+
+    return imgMatrix
+
+# cache folder of an image folder: named after the folder, plus a hash of its absolute path,
+# plus the resolution unless full
+def cachePath(folder, resolution='1'):
+    folder = os.path.abspath(folder)
+    digest = hashlib.sha1(folder.encode('utf-8')).hexdigest()[:12]
+    return cacheFolder + os.path.basename(folder.rstrip('/')) + '-' + digest + resolutionSuffix(resolution) + '/'
+
+# file of this process standing for the cache file 'name' (e.g. "pixels.npy") of the cache folder 'path'
+# while it is written: cache folders are shared by every script, so that runs at the same time never write
+# into the same file, each one moving its complete file onto 'name' with os.replace
+def tmpPath(path, name):
+    base, extension = os.path.splitext(name)
+    return path + base + '.' + str(os.getpid()) + '.tmp' + extension
+
+# saving 'array' as the cache file 'name' of the cache folder 'path', through tmpPath
+def saveCached(path, name, array):
+    np.save(tmpPath(path, name), array)
+    os.replace(tmpPath(path, name), path + name)
+
+# saving the manifest of the cache folder 'path', through tmpPath, once every other file of it is written
+def saveManifest(path, files):
+    with open(tmpPath(path, 'manifest.json'), 'w') as manifestFile:
+        json.dump({'files': files}, manifestFile)
+    os.replace(tmpPath(path, 'manifest.json'), path + 'manifest.json')
+
+# cached version of decodeImages, for the images of 'folder'
+# a manifest lists (path, size, mtime) of every cached row: rows whose file is unchanged are copied
+# from the cache, only added or changed images are decoded; if nothing changed at all, the cached
+# matrix is memory-mapped as is; the named arrays (labels, filenames) are stored next to it
+# the images are decoded straight into the rows of the new, memory-mapped cache file, and the unchanged
+# rows are copied block by block, so that the matrix is never held in memory as a whole
+# images decoded at another size than the cached ones are an error, the cache having to be deleted
+# returns the matrix (memory-mapped, read-only) and the number of images taken from the cache
+def decodeCached(pathList, folder, nWorkers=None, progress=None, resolution='1', **arrays):
+    # nothing to decode nor to cache in an empty folder
+    if len(pathList) == 0:
+        return np.empty((0, 0), dtype=np.uint8), 0
+
+    path = cachePath(folder, resolution)
+    os.makedirs(path, exist_ok=True)
+    files = []
+    for imgPath in pathList:
+        stat = os.stat(imgPath)
+        files.append([imgPath, stat.st_size, stat.st_mtime_ns])
+
+    # reading the previous manifest, if any
+    manifest = None
+    if os.path.isfile(path + 'manifest.json') and os.path.isfile(path + 'pixels.npy'):
+        with open(path + 'manifest.json') as manifestFile:
+            manifest = json.load(manifestFile)
+    if manifest is not None and manifest['files'] == files:
+        return np.load(path + 'pixels.npy', mmap_mode='r'), len(files)
+
+    # rows still valid in the previous cache
+    cachedRows = {}; oldMatrix = None
+    if manifest is not None:
+        oldMatrix = np.load(path + 'pixels.npy', mmap_mode='r')
+        cachedRows = {tuple(entry): row for row, entry in enumerate(manifest['files'])}
+    rows = np.array([cachedRows.get(tuple(entry), -1) for entry in files], dtype=np.int64)
+    todo = np.flatnonzero(rows < 0); kept = np.flatnonzero(rows >= 0)
+
+    # writing the new matrix next to the old one, then swapping them
+    # its width is that of the decoded images, or of the cached ones if nothing has to be decoded
+    def allocate(width):
+        return np.lib.format.open_memmap(tmpPath(path, 'pixels.npy'), mode='w+', dtype=np.uint8, shape=(len(files), width))
+    if todo.size > 0:
+        imgMatrix = decodeImages([pathList[row] for row in todo], nWorkers, progress, resolution, allocate, todo)
+    else:
+        imgMatrix = allocate(oldMatrix.shape[1])
+
+    # images of a different size than the cached ones: the unchanged images cannot be of the new size
+    if kept.size > 0 and imgMatrix.shape[1] != oldMatrix.shape[1]:
+        width = imgMatrix.shape[1]; imgMatrix = None
+        os.remove(tmpPath(path, 'pixels.npy'))
+        raise ValueError('Images of "{}" changed size ({} pixels instead of {}), delete {} or use --no-cache!'.format(
+                         folder, width, oldMatrix.shape[1], path))
+
+    # unchanged rows, copied by blocks of about 64 MiB
+    blockRows = max(1, 67108864 // max(imgMatrix.shape[1], 1))
+    for start in range(0, kept.size, blockRows):
+        block = kept[start:start + blockRows]
+        imgMatrix[block] = oldMatrix[rows[block]]
+    imgMatrix.flush()
+    imgMatrix = oldMatrix = None
+    os.replace(tmpPath(path, 'pixels.npy'), path + 'pixels.npy')
+    for name, array in arrays.items():
+        saveCached(path, name + '.npy', np.asarray(array))
+    saveManifest(path, files)
+
+    return np.load(path + 'pixels.npy', mmap_mode='r'), int(kept.size)
+
+# writing one shard file from the images of pathList, labelled by labelList (None if unlabelled)
+# under the names of nameList
+def writeShard(path, pathList, nameList, labelList=None):
+    labels = [] if labelList is None else sorted(set(labelList))
+    codes = np.full(len(pathList), -1, dtype=np.int32)
+    if labelList is not None:
+        codes[:] = [labels.index(label) for label in labelList]
+    table = json.dumps({'labels': labels, 'names': list(nameList)}).encode('utf-8')
+
+    blobs = []
+    for imgPath in pathList:
+        with open(imgPath, 'rb') as imgFile:
+            blobs.append(imgFile.read())
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(blob) for blob in blobs])
+
+    with open(path, 'wb') as shardFile:
+        shardFile.write(shardHeader.pack(shardMagic, shardVersion, len(blobs), len(table)))
+        shardFile.write(table)
+        shardFile.write(offsets.tobytes())
+        shardFile.write(codes.tobytes())
+        for blob in blobs:
+            shardFile.write(blob)
+
+# reading one whole shard file at once
+# returns the buffer, the offsets of the images in it, their names and their labels (None if unlabelled)
+def readShard(path):
+    with open(path, 'rb') as shardFile:
+        buffer = shardFile.read()
+    magic, version, count, tableLength = shardHeader.unpack_from(buffer)
+    if magic != shardMagic or version != shardVersion:
+        raise ValueError('"{}" is not a shard file of version {}!'.format(path, shardVersion))
+    start = shardHeader.size
+    table = json.loads(buffer[start:start + tableLength].decode('utf-8')); start += tableLength
+    offsets = np.frombuffer(buffer, dtype=np.int64, count=count + 1, offset=start); start += 8 * (count + 1)
+    codes = np.frombuffer(buffer, dtype=np.int32, count=count, offset=start); start += 4 * count
+    labelList = np.array(table['labels'])[codes] if table['labels'] else None
+    return buffer, offsets + start, table['names'], labelList
+
+# whether 'folder' is a shard folder
+def isShardFolder(folder):
+    return os.path.isfile(folder + shardIndex)
+
+# shard files of a shard folder, with the number of images of each
+def listShards(shardFolder):
+    with open(shardFolder + shardIndex) as indexFile:
+        index = json.load(indexFile)
+    return [shardFolder + shard['file'] for shard in index['shards']], [shard['count'] for shard in index['shards']]
+
+# decoding one encoded image of a shard buffer into a flattened grayscale row, at the given resolution
+def decodeBlob(buffer, start, end, name, resolution='1'):
+    flag, shape = resolutionFlags(resolution)
+    return flattenImage(cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8, count=end - start, offset=start), flag), shape, name)
+
+# decoding the images [start, end) of a shard buffer into the rows of imgMatrix from 'row' on
+# returns the number of decoded images
+def decodeBlobsInto(imgMatrix, row, buffer, offsets, names, start, end, resolution='1'):
+    for enum in range(start, end):
+        pixels = decodeBlob(buffer, offsets[enum], offsets[enum + 1], names[enum], resolution)
+        if pixels.size != imgMatrix.shape[1]:
+            raise ValueError('Image "{}" has {} pixels, expected {}!'.format(names[enum], pixels.size, imgMatrix.shape[1]))
+        imgMatrix[row + enum] = pixels
+    return end - start
+
+# decoding every image of a shard folder into one (images x pixels) uint8 matrix, allocated once
+# shards are read one after the other, the next one being read by a background thread while the current
+# one is decoded; the images of each shard are cut into chunks of at most chunkImages images, decoded by
+# nWorkers threads (one per core by default) straight into their own rows, so that a single shard
+# still keeps every thread busy
+# the matrix is allocated as in decodeImages, by allocate(width) if given
+# progress(count) is called from the calling thread after each decoded chunk, in order
+# returns the matrix, the names of the images and their labels (None if unlabelled)
+def decodeShards(shardFolder, nWorkers=None, progress=None, resolution='1', chunkImages=256, allocate=None):
+    shardList, countList = listShards(shardFolder)
+    cntimg = int(sum(countList)); nWorkers = nWorkers or os.cpu_count()
+    nameList = []; shardLabels = []; imgMatrix = None; row = 0
+    if cntimg == 0:
+        return np.empty((0, 0), dtype=np.uint8), nameList, None
+
+    with ThreadPoolExecutor(max_workers=1) as reader, ThreadPoolExecutor(max_workers=nWorkers) as pool:
+        nextShard = reader.submit(readShard, shardList[0])
+        for shardid in range(len(shardList)):
+            buffer, offsets, names, labels = nextShard.result()
+            if shardid + 1 < len(shardList):
+                nextShard = reader.submit(readShard, shardList[shardid + 1])
+
+            # the first image gives the width of the matrix
+            if imgMatrix is None and len(names) > 0:
+                width = decodeBlob(buffer, offsets[0], offsets[1], names[0], resolution).size
+                imgMatrix = np.empty((cntimg, width), dtype=np.uint8) if allocate is None else allocate(width)
+
+            # chunks small enough for every thread to get a few of them
+            chunk = max(1, min(chunkImages, -(-len(names) // (4 * nWorkers))))
+            futures = [pool.submit(decodeBlobsInto, imgMatrix, row, buffer, offsets, names, start,
+                                   min(start + chunk, len(names)), resolution) for start in range(0, len(names), chunk)]
+            for future in futures:
+                row += future.result()
+                if progress is not None:
+                    progress(row)
+            nameList.extend(names); shardLabels.append(labels)
+
+    # labels of the whole folder, if every shard is labelled
+    labelList = None
+    if all(labels is not None for labels in shardLabels):
+        labelList = np.concatenate(shardLabels)
+    return imgMatrix, nameList, labelList
+
+# cached version of decodeShards: the manifest lists (path, size, mtime) of every shard file,
+# and the whole folder is decoded again as soon as any shard changed, straight into the new,
+# memory-mapped cache file
+# returns the matrix (memory-mapped, read-only), the names, the labels and the number of images taken from the cache
+def decodeShardsCached(shardFolder, nWorkers=None, progress=None, resolution='1'):
+    path = cachePath(shardFolder, resolution)
+    os.makedirs(path, exist_ok=True)
+    files = []; shardList, countList = listShards(shardFolder)
+    for shardPath in shardList:
+        stat = os.stat(shardPath)
+        files.append([shardPath, stat.st_size, stat.st_mtime_ns])
+
+    # nothing changed: everything comes from the cache
+    if os.path.isfile(path + 'manifest.json') and os.path.isfile(path + 'pixels.npy'):
+        with open(path + 'manifest.json') as manifestFile:
+            if json.load(manifestFile)['files'] == files:
+                imgMatrix = np.load(path + 'pixels.npy', mmap_mode='r')
+                labelList = np.load(path + 'labels.npy') if os.path.isfile(path + 'labels.npy') else None
+                return imgMatrix, np.load(path + 'names.npy').tolist(), labelList, len(imgMatrix)
+
+    def allocate(width):
+        return np.lib.format.open_memmap(tmpPath(path, 'pixels.npy'), mode='w+', dtype=np.uint8, shape=(int(sum(countList)), width))
+    imgMatrix, nameList, labelList = decodeShards(shardFolder, nWorkers, progress, resolution, allocate=allocate)
+    if len(nameList) == 0:
+        np.save(tmpPath(path, 'pixels.npy'), imgMatrix)
+    else:
+        imgMatrix.flush()
+    del imgMatrix
+    os.replace(tmpPath(path, 'pixels.npy'), path + 'pixels.npy')
+    saveCached(path, 'names.npy', np.array(nameList))
+    if labelList is not None:
+        saveCached(path, 'labels.npy', labelList)
+    elif os.path.isfile(path + 'labels.npy'):
+        os.remove(path + 'labels.npy')
+    saveManifest(path, files)
+
+    return np.load(path + 'pixels.npy', mmap_mode='r'), nameList, labelList, 0
+
+# loading a training folder, either plain (one subfolder per label) or packed into shards, at the given resolution
+# returns the image matrix, the labels and the number of images taken from the cache
+def loadTrainingFolder(trainingFolder, useCache=True, nWorkers=None, progress=None, resolution='1'):
+    if isShardFolder(trainingFolder):
+        if not useCache:
+            imgMatrix, nameList, labelList = decodeShards(trainingFolder, nWorkers, progress, resolution)
+            return imgMatrix, labelList, 0
+        imgMatrix, nameList, labelList, cntcached = decodeShardsCached(trainingFolder, nWorkers, progress, resolution)
+        return imgMatrix, labelList, cntcached
+    pathList, labelList = listTrainingImages(trainingFolder)
+    if not useCache:
+        return decodeImages(pathList, nWorkers, progress, resolution), labelList, 0
+    imgMatrix, cntcached = decodeCached(pathList, trainingFolder, nWorkers, progress, resolution, labels=labelList)
+    return imgMatrix, labelList, cntcached
+
+# loading a test folder, either plain or packed into shards, at the given resolution
+# if lazy, a plain folder read without the cache is not decoded yet, but returned as LazyImages
+# returns the image matrix, the filenames and the number of images taken from the cache
+def loadTestFolder(testdataFolder, useCache=True, nWorkers=None, progress=None, lazy=False, resolution='1'):
+    if isShardFolder(testdataFolder):
+        if not useCache:
+            imgMatrix, fnameList, labelList = decodeShards(testdataFolder, nWorkers, progress, resolution)
+            return imgMatrix, fnameList, 0
+        imgMatrix, fnameList, labelList, cntcached = decodeShardsCached(testdataFolder, nWorkers, progress, resolution)
+        return imgMatrix, fnameList, cntcached
+    pathList, fnameList = listTestImages(testdataFolder)
+    if not useCache and lazy:
+        return LazyImages(pathList, nWorkers, resolution), fnameList, 0
+    if not useCache:
+        return decodeImages(pathList, nWorkers, progress, resolution), fnameList, 0
+    imgMatrix, cntcached = decodeCached(pathList, testdataFolder, nWorkers, progress, resolution, filenames=fnameList)
+    return imgMatrix, fnameList, cntcached
+
+# feature matrix of the images, as the dtype a module works with internally (None keeps the pixels as uint8)
+# modules convert their input into that dtype on every fit and predict, unless it already is: converting
+# once lets every fit and prediction of a sweep share one matrix instead of making their own copy
+# if sparse, the features are a CSR matrix holding only the non-zero pixels, built block by block
+# from the uint8 pixels, so that neither a dense float copy nor a second uint8 copy is ever made
+# LazyImages are left as they are, being converted batch by batch
+def asFeatures(images, dtype, sparse=False, blockRows=65536):
+    if isinstance(images, LazyImages):
+        return images
+    if sparse:
+        if not scipy.sparse.issparse(images):
+            blocks = [scipy.sparse.csr_matrix(np.asarray(images[start:start + blockRows]))
+                      for start in range(0, images.shape[0], blockRows)]
+            images = scipy.sparse.vstack(blocks, format='csr') if blocks else scipy.sparse.csr_matrix(images.shape, dtype=np.uint8)
+        return images if dtype is None else images.astype(dtype, copy=False)
+    if dtype is None:
+        return images
+    return np.ascontiguousarray(images, dtype=dtype)
+
+# number of images of a feature matrix (dense or sparse) or of LazyImages
+def countImages(images):
+    return images.shape[0] if hasattr(images, 'shape') else len(images)
+
+# memory held by a feature matrix, dense or sparse
+def featureBytes(images):
+    if scipy.sparse.issparse(images):
+        return images.data.nbytes + images.indices.nbytes + images.indptr.nbytes
+    return images.nbytes
+
+# images of pathList, only decoded batch by batch (see iterateBatches)
+class LazyImages:
+    def __init__(self, pathList, nWorkers=None, resolution='1'):
+        self.pathList = pathList; self.nWorkers = nWorkers; self.resolution = resolution
+
+    def __len__(self):
+        return len(self.pathList)
+
+    # matrix of the images [start, end)
+    def batch(self, start, end):
+        return decodeImages(self.pathList[start:end], self.nWorkers, resolution=self.resolution)
+
+# yielding (start, matrix) for consecutive batches of batchSize images of 'images', a matrix (memory-mapped
+# or not, dense or sparse) or LazyImages, each batch converted into features of 'dtype' (see asFeatures);
+# the next batch is read or decoded by a background thread while the current one is being used, so that
+# at most two batches are held in memory at once
+# 'projection' (see Projection) is applied to each batch before its conversion, if given
+def iterateBatches(images, batchSize, dtype=None, sparse=False, projection=None):
+    def load(start, end):
+        if isinstance(images, LazyImages):
+            batch = images.batch(start, end)
+        elif scipy.sparse.issparse(images):
+            batch = images[start:end]
+        else:
+            batch = np.array(images[start:end])
+        if projection is not None:
+            batch = projection.transform(batch)
+        return asFeatures(batch, dtype, sparse)
+    cntimg = countImages(images)
+
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        future = prefetcher.submit(load, 0, min(batchSize, cntimg)) if cntimg > 0 else None
+        for start in range(0, cntimg, batchSize):
+            batch = future.result()
+            if start + batchSize < cntimg:
+                future = prefetcher.submit(load, start + batchSize, min(start + 2 * batchSize, cntimg))
+            yield start, batch
+
+# projections into fewer dimensions: "pca:<components>" (randomized PCA) or "random:<components>"
+# (sparse random projection), fitted on the training images
+def isProjection(method):
+    return re.fullmatch(r'(pca|random):[1-9][0-9]*', method) is not None
+
+# linear projection of images into fewer dimensions: (pixels - mean) . components^T, float32
+# computed as pixels . components^T - mean . components^T, so that sparse pixels stay sparse
+class Projection:
+    def __init__(self, mean, components):
+        self.mean = np.asarray(mean, dtype=np.float32); self.components = np.asarray(components, dtype=np.float32)
+        self.offset = self.mean @ self.components.T
+
+    # projected images, computed block by block so that no float copy of all the pixels is ever made
+    def transform(self, images, blockRows=65536):
+        cntimg = countImages(images)
+        projected = np.empty((cntimg, self.components.shape[0]), dtype=np.float32)
+        for start in range(0, cntimg, blockRows):
+            block = images[start:start + blockRows]
+            block = block.astype(np.float32) if scipy.sparse.issparse(block) else np.asarray(block, dtype=np.float32)
+            projected[start:start + blockRows] = block @ self.components.T - self.offset
+        return projected
+
+# projection of 'method' (see isProjection) fitted on the training images imgMatrix
+# with the cache, it is saved next to the decoded training folder, along with a digest of its manifest,
+# and taken from there as long as the training images did not change
+# returns the Projection and whether it was taken from the cache
+def loadProjection(method, imgMatrix, trainingFolder, resolution='1', useCache=True):
+    kind, components = method.split(':'); components = int(components)
+    path = cachePath(trainingFolder, resolution)
+    digest = None
+    if useCache and os.path.isfile(path + 'manifest.json'):
+        with open(path + 'manifest.json', 'rb') as manifestFile:
+            digest = hashlib.sha1(manifestFile.read()).hexdigest()
+    projectionPath = path + 'projection-' + kind + '-' + str(components) + '.npz'
+    if digest is not None and os.path.isfile(projectionPath):
+        saved = np.load(projectionPath)
+        if str(saved['digest']) == digest:
+            return Projection(saved['mean'], saved['components']), True
+
+    # randomized PCA is fitted on the pixels, a sparse random projection only on their shape
+    if kind == 'pca':
+        from sklearn.decomposition import PCA
+        pca = PCA(n_components=components, svd_solver='randomized', random_state=0)
+        pca.fit(np.asarray(imgMatrix, dtype=np.float32))
+        mean, matrix = pca.mean_, pca.components_
+    else:
+        from sklearn.random_projection import SparseRandomProjection
+        randomProjection = SparseRandomProjection(n_components=components, random_state=0)
+        randomProjection.fit(imgMatrix[:1])
+        mean, matrix = np.zeros(imgMatrix.shape[1]), randomProjection.components_.toarray()
+    projection = Projection(mean, matrix)
+
+    if digest is not None:
+        np.savez(tmpPath(path, os.path.basename(projectionPath)), mean=projection.mean, components=projection.components, digest=digest)
+        os.replace(tmpPath(path, os.path.basename(projectionPath)), projectionPath)
+    return projection, False
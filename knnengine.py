@@ -0,0 +1,90 @@
+# nearest neighbors engine of kNN-ImageClassifications.py
+# a sweep over k (1..maxNeighbors) only needs the maxNeighbors nearest neighbors of each test image:
+# the vote of every smaller k comes from a prefix of them, so the neighbors are searched once per sweep
+
+import numpy as np
+
+# distance-weighted votes of the k nearest neighbors, for every k of a sweep, from the (distances, indices)
+# of the maxNeighbors nearest neighbors of each test image (sorted by distance, as given by kneighbors)
+# votes are those of KNeighborsClassifier(weights='distance'): each neighbor weighs 1 / distance, except
+# that test images with neighbors at distance 0 only count those; ties go to the first class in sorted order
+# (neighbors tied in distance around the k-th one may however be chosen differently than by a k-search)
+class NeighborVotes:
+    def __init__(self, distances, indices, trainLabels):
+        self.classes, codes = np.unique(np.asarray(trainLabels), return_inverse=True)
+        self.codes = codes.ravel()[indices]
+        with np.errstate(divide='ignore'):
+            self.weights = 1.0 / distances
+        exact = distances[:, 0] == 0
+        self.weights[exact] = distances[exact] == 0
+
+        # votes of the first k neighbors, per test image and per class
+        self.votes = np.zeros((len(distances), len(self.classes)))
+        self.k = 0
+
+    # labels predicted with the k nearest neighbors; calls with increasing k only add the new neighbors' votes
+    def predict(self, k):
+        if k < self.k:
+            self.votes[:] = 0; self.k = 0
+        rows = np.arange(len(self.votes))
+        for column in range(self.k, k):
+            self.votes[rows, self.codes[:, column]] += self.weights[:, column]
+        self.k = k
+        return self.classes[np.argmax(self.votes, axis=1)]
+
+# brute-force nearest neighbors (euclidean), as KNeighborsClassifier's fit() and kneighbors(), in float32
+# squared distances are computed tile by tile as |a|^2 + |b|^2 - 2 a.b, the a.b products being one matrix
+# multiplication per tile (multi-threaded BLAS); each block of test images keeps a running top-k over the
+# tiles of training images (argpartition), so that memory stays within about memoryMiB whatever the sizes
+# the distances of the final k neighbors are then computed again directly, as |a - b|, which the identity
+# would blur by cancellation (duplicates getting small non-zero distances), and sorted
+class BlockedNeighbors:
+    def __init__(self, n_neighbors=5, memoryMiB=256, tileRows=8192):
+        self.n_neighbors = n_neighbors; self.memoryMiB = memoryMiB; self.tileRows = tileRows
+
+    # keeping the training images as float32, along with their squared norms
+    def fit(self, X, y=None):
+        self.trainX = np.ascontiguousarray(X, dtype=np.float32)
+        self.trainNorms = np.einsum('ij,ij->i', self.trainX, self.trainX)
+        return self
+
+    # distances and indices of the n_neighbors nearest training images of each image of X, sorted by distance
+    # (then by index, for neighbors tied in distance)
+    def kneighbors(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        k = self.n_neighbors; cntTrain, cntFeatures = self.trainX.shape
+        if k > cntTrain:
+            raise ValueError('Expected n_neighbors <= n_samples_fit, but n_neighbors = {}, n_samples_fit = {}'.format(k, cntTrain))
+        tileRows = min(self.tileRows, cntTrain)
+
+        # rows of a block of test images: their tile of distances, candidates (twice), and final differences
+        blockRows = max(1, self.memoryMiB * 1048576 // (4 * (3 * (tileRows + k) + k * cntFeatures)))
+
+        distances = np.empty((len(X), k)); indices = np.empty((len(X), k), dtype=np.int64)
+        for start in range(0, len(X), blockRows):
+            block = X[start:start + blockRows]
+            blockNorms = np.einsum('ij,ij->i', block, block)
+            bestDistances = np.empty((len(block), 0), dtype=np.float32); bestIndices = np.empty((len(block), 0), dtype=np.int64)
+
+            for tileStart in range(0, cntTrain, tileRows):
+                tileEnd = min(tileStart + tileRows, cntTrain)
+                tile = block @ self.trainX[tileStart:tileEnd].T
+                tile *= -2; tile += blockNorms[:, None]; tile += self.trainNorms[None, tileStart:tileEnd]
+
+                # running top-k: the k best among the previous best and this tile
+                candDistances = np.concatenate((bestDistances, tile), axis=1)
+                candIndices = np.concatenate((bestIndices, np.broadcast_to(np.arange(tileStart, tileEnd), tile.shape)), axis=1)
+                if candDistances.shape[1] > k:
+                    best = np.argpartition(candDistances, k - 1, axis=1)[:, :k]
+                    candDistances = np.take_along_axis(candDistances, best, axis=1)
+                    candIndices = np.take_along_axis(candIndices, best, axis=1)
+                bestDistances, bestIndices = candDistances, candIndices
+
+            # exact distances of the k neighbors, sorted
+            differences = self.trainX[bestIndices] - block[:, None, :]
+            exact = np.sqrt(np.einsum('ijk,ijk->ij', differences, differences))
+            order = np.lexsort((bestIndices, exact))
+            distances[start:start + len(block)] = np.take_along_axis(exact, order, axis=1)
+            indices[start:start + len(block)] = np.take_along_axis(bestIndices, order, axis=1)
+
+        return distances, indices
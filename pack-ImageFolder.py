@@ -0,0 +1,99 @@
+# put this python source code next to imageloader.py
+# command line scripts: "python3 thisfilename.py <imageFolder> <shardFolder> [<shardSizeMiB>]"
+# constraints (1): <imageFolder> must exist, laid out either as a training folder (one subfolder per label)
+# or as a testdata folder (unlabelled images only)
+# constraints (2): <shardFolder> must not exist yet
+# constraints (3): <shardSizeMiB> is optional (64 by default), yet if defined, must be a positive integer
+
+# packs the images of <imageFolder> into a few large shard files (see imageloader.writeShard), so that
+# the *-ImageClassifications.py scripts read a handful of files sequentially instead of opening every image
+# the encoded images are copied as they are, only <shardFolder> has to be given instead of <imageFolder>
+
+from sys import argv
+import os, time, sys, json
+from glob import glob
+import imageloader, progresslog
+
+# exception handling
+def filteringException():
+    if len(argv) != 3 and len(argv) != 4:
+        # incorrect arguments count
+        print('Incorrect format!')
+        print('Valid format: "python3 thisfilename.py <imageFolder> <shardFolder> [<shardSizeMiB>]"')
+        sys.exit(-1)
+    else:
+        # image folder not found
+        if not os.path.isdir(argv[1]):
+            print('Image folder "{}" not found!'.format(argv[1]))
+            sys.exit(-4041)
+
+        # shard folder already exists
+        if os.path.exists(argv[2]):
+            print('Error, folder {} already exists!'.format(argv[2]))
+            sys.exit(-4096)
+
+        if len(argv) == 4:
+            # non-integers arguments at argv[3]
+            try: int(argv[3])
+            except ValueError as ex3:
+                print('{} cannot be parsed into int: {}'.format(argv[3], ex3))
+                sys.exit(-43)
+
+            # non-positive arguments at argv[3]
+            if int(argv[3]) <= 0:
+                print('Invalid argv[3]: <shardSizeMiB> must be a positive integer!')
+                sys.exit(-443)
+
+# processing arguments after surpassed all exception tests
+def processArguments():
+    imageFolder = argv[1] + '/'
+    shardFolder = argv[2] + '/'
+    shardSize = (int(argv[3]) if len(argv) == 4 else 64) * 1048576
+    return imageFolder, shardFolder, shardSize
+
+# main function of this source code
+def mainFunction(imageFolder, shardFolder, shardSize):
+    startTime = time.time()
+
+    # a folder with subfolders is a training folder, labelled by the subfolders' names
+    if glob(imageFolder + '*/'):
+        pathList, labelList = imageloader.listTrainingImages(imageFolder)
+        nameList = [path.replace(imageFolder, '') for path in pathList]
+        labelList = labelList.tolist()
+        print('Found ' + str(len(pathList)) + ' images in ' + str(len(set(labelList))) + ' labels.', flush=True)
+    else:
+        pathList, nameList = imageloader.listTestImages(imageFolder)
+        labelList = None
+        print('Found ' + str(len(pathList)) + ' unlabelled images.', flush=True)
+
+    # cutting the images into consecutive shards of about shardSize bytes each
+    os.mkdir(shardFolder)
+    shards = []; start = 0
+    progress = progresslog.Progress('pack', print, total=len(pathList))
+    while start < len(pathList):
+        end = start; size = 0
+        while end < len(pathList) and (end == start or size + os.path.getsize(pathList[end]) <= shardSize):
+            size += os.path.getsize(pathList[end]); end += 1
+        shardFile = 'shard-%05d.bin' % len(shards)
+        imageloader.writeShard(shardFolder + shardFile, pathList[start:end], nameList[start:end],
+                               None if labelList is None else labelList[start:end])
+        shards.append({'file': shardFile, 'count': end - start})
+        progress.update(end)
+        start = end
+    progress.done()
+
+    # the shard index, written last: a half-packed folder is never taken for a shard folder
+    with open(shardFolder + imageloader.shardIndex, 'w') as indexFile:
+        json.dump({'shards': shards}, indexFile)
+
+    endTime = time.time()
+    print('Successfully packed ' + str(len(pathList)) + ' images into ' + str(len(shards)) + ' shards in ' + shardFolder + '.', flush=True)
+    print('Elapsed time: ' + str(endTime - startTime) + ' seconds.', flush=True)
+
+if __name__ == "__main__":
+    # handling exceptions and arguments
+    filteringException()
+    imageFolder, shardFolder, shardSize = processArguments()
+
+    # main packing
+    mainFunction(imageFolder, shardFolder, shardSize)
@@ -0,0 +1,50 @@
+# prediction process pool shared by the *-ImageClassifications.py scripts (--jobs)
+# the fitted model is sent once to each worker process, then the images of every call are cut into
+# shards of rows, predicted in parallel
+# the workers are started by a fork server (or spawned where there is none), never forked from the script
+# itself: they start at the first call, while the batch prefetching thread may be decoding images with its
+# own threads, whose locks a fork would copy in whatever state they are
+
+import multiprocessing
+import numpy as np
+import scipy.sparse
+from concurrent.futures import ProcessPoolExecutor
+
+# fitted model of a prediction worker process, received once when the worker starts
+workerModel = None
+
+def initPredictionWorker(model):
+    global workerModel
+    workerModel = model
+
+def predictionWorker(method, images):
+    return getattr(workerModel, method)(images)
+
+# predicting with a pool of nJobs processes: each worker receives the fitted model once, then every
+# call of predict() (or of any other method of the model, through call()) cuts the images (dense or sparse)
+# into nJobs shards of rows, predicted in parallel, whose predictions are put back together in the order
+# of the images; methods returning tuples of arrays (as kneighbors) get each array put back together
+class PredictionPool:
+    def __init__(self, model, nJobs):
+        self.nJobs = nJobs
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.pool = ProcessPoolExecutor(max_workers=nJobs, mp_context=multiprocessing.get_context(method),
+                                        initializer=initPredictionWorker, initargs=(model,))
+
+    def call(self, method, images):
+        if not scipy.sparse.issparse(images):
+            images = np.asarray(images)
+        bounds = np.linspace(0, images.shape[0], self.nJobs + 1).astype(np.int64)
+        shards = [images[start:end] for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+        if len(shards) == 0:
+            return np.empty(0)
+        parts = list(self.pool.map(predictionWorker, [method] * len(shards), shards))
+        if isinstance(parts[0], tuple):
+            return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+        return np.concatenate(parts)
+
+    def predict(self, images):
+        return self.call('predict', images)
+
+    def close(self):
+        self.pool.shutdown()
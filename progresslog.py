@@ -0,0 +1,53 @@
+# progress reporting shared by the *-ImageClassifications.py scripts
+# a Progress is updated as often as wanted (once per image...), yet only redraws its console line
+# every 'interval' seconds or every 'every' items, and only reaches the log once, when done, as one
+# structured record: stage, count, total, rate and elapsed time
+
+import sys, time
+
+class Progress:
+    # stage: name of what is being counted, e.g. "decode-training"
+    # write: function used for the final record, as write(str, end, flush) of the scripts (print works too)
+    # total: number of items expected, if known
+    # interval: minimal number of seconds between two console updates
+    # every: number of items after which the console is updated anyway, None to only follow the interval
+    def __init__(self, stage, write, total=None, interval=0.5, every=None):
+        self.stage = stage; self.write = write; self.total = total
+        self.interval = interval; self.every = every
+        self.startTime = time.perf_counter(); self.lastTime = self.startTime
+        self.count = 0; self.lastCount = 0; self.lastLength = 0
+
+    # structured record of the progress so far
+    def record(self):
+        elapsed = time.perf_counter() - self.startTime
+        return {'stage': self.stage, 'count': self.count, 'total': self.total,
+                'rate': self.count / elapsed if elapsed > 0 else 0.0, 'elapsed': elapsed}
+
+    # record as one "key=value" line
+    def format(self):
+        record = self.record()
+        line = 'Progress: stage={} count={}'.format(record['stage'], record['count'])
+        if record['total'] is not None:
+            line += ' total={}'.format(record['total'])
+        return line + ' rate={:.1f}/s elapsed={:.3f}s'.format(record['rate'], record['elapsed'])
+
+    # count items done so far; the console line is only redrawn once the interval or item count is reached
+    def update(self, count):
+        self.count = count
+        now = time.perf_counter()
+        if now - self.lastTime < self.interval and (self.every is None or count - self.lastCount < self.every):
+            return
+        self.lastTime = now; self.lastCount = count
+        line = self.format()
+        sys.stdout.write('\r' + line + ' ' * max(self.lastLength - len(line), 0))
+        sys.stdout.flush()
+        self.lastLength = len(line)
+
+    # final record, written to both console and log; count defaults to the last update
+    def done(self, count=None):
+        if count is not None:
+            self.count = count
+        if self.lastLength > 0:
+            sys.stdout.write('\r' + ' ' * self.lastLength + '\r')
+        self.write(self.format(), flush=True)
+        return self.record()
@@ -0,0 +1,60 @@
+# prediction results shared by the *-ImageClassifications.py scripts
+# results are written batch by batch, each batch in one call: either into one csv per configuration
+# of a sweep (ImageID,Label), or all configurations of the sweep into one columnar file
+# (config, ImageID, Label), ".npz" with numpy, or ".parquet" if pyarrow is installed
+
+import importlib.util
+import numpy as np
+
+# columnar formats, and whether each of them can be written here
+columnarFormats = {
+    'npz': True,
+    'parquet': importlib.util.find_spec('pyarrow') is not None
+}
+
+class ResultWriter:
+    # columnarPath: path of the columnar file gathering every configuration, None to write one csv per configuration
+    def __init__(self, columnarPath=None):
+        self.columnarPath = columnarPath
+        self.csvOutput = None; self.config = None
+        self.configList = []; self.fnameList = []; self.labelList = []
+
+    # starting the results of one configuration, written into csvFileName unless columnar
+    # returns the name of the target, for logging
+    def begin(self, csvFileName, config):
+        self.config = config
+        if self.columnarPath is not None:
+            return self.columnarPath + ' (config ' + config + ')'
+        self.csvOutput = open(csvFileName, 'w')
+        self.csvOutput.write('ImageID,Label\n')
+        return csvFileName
+
+    # writing the labels predicted for a batch of filenames
+    def write(self, fnameList, labelList):
+        fnames = np.asarray(fnameList, dtype=str); labels = np.asarray(labelList).astype(str)
+        if self.columnarPath is not None:
+            self.configList.append(np.full(len(fnames), self.config)); self.fnameList.append(fnames); self.labelList.append(labels)
+        elif len(fnames) > 0:
+            self.csvOutput.write('\n'.join(np.char.add(np.char.add(fnames, ','), labels).tolist()) + '\n')
+            self.csvOutput.flush()
+
+    # ending the results of the current configuration
+    def end(self):
+        if self.csvOutput is not None:
+            self.csvOutput.close()
+            self.csvOutput = None
+
+    # writing the columnar file, once every configuration is done
+    def finish(self):
+        if self.columnarPath is None:
+            return
+        columns = {}
+        for name, chunks in (('config', self.configList), ('ImageID', self.fnameList), ('Label', self.labelList)):
+            columns[name] = np.concatenate(chunks) if chunks else np.empty(0, dtype=str)
+        if self.columnarPath.endswith('.parquet'):
+            import pyarrow, pyarrow.parquet
+            table = pyarrow.table({'config': pyarrow.array(columns['config']).dictionary_encode(),
+                                   'ImageID': columns['ImageID'], 'Label': pyarrow.array(columns['Label']).dictionary_encode()})
+            pyarrow.parquet.write_table(table, self.columnarPath)
+        else:
+            np.savez(self.columnarPath, **columns)